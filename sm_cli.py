@@ -5,13 +5,24 @@ SM-CLI: 智能网络设备管理命令行工具
 """
 
 import os
+import re
 import sys
 import json
-import argparse
+import time
+import atexit
+import hashlib
+import functools
 import sqlite3
+import stat
+import tempfile
+import threading
+import types
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, Optional, List, Tuple
-import readline
+from typing import TYPE_CHECKING, Callable, Dict, Any, Iterable, Optional, List, Tuple
 import warnings
 
 # 在导入任何可能产生警告的模块之前，先抑制所有相关警告
@@ -20,10 +31,379 @@ warnings.filterwarnings("ignore", message=".*TripleDES.*")
 warnings.filterwarnings("ignore", module="paramiko")
 warnings.filterwarnings("ignore", module="cryptography")
 
-from smolagents import LiteLLMModel, CodeAgent
-from smolagents.agents import PromptTemplates
 from smolagents.tools import Tool
-import paramiko
+
+# paramiko、readline和LLM相关模块较重，仅在实际使用时导入
+if TYPE_CHECKING:
+    import paramiko
+
+# orjson为可选依赖，未安装时回退到标准库json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+@functools.lru_cache(maxsize=None)
+def _paramiko():
+    """按需导入paramiko"""
+    import paramiko
+    return paramiko
+
+HISTORY_LENGTH = 1000  # 交互式命令历史最大条数
+
+# SSH连接池参数
+CONNECTION_POOL_IDLE_TIMEOUT = 300  # 空闲连接超时时间（秒）
+CONNECTION_POOL_MAX_CONNECTIONS = 16  # 连接池最大连接数
+SSH_KEEPALIVE_INTERVAL = 30  # SSH keepalive间隔（秒），避免NAT超时断开
+SSH_BATCH_MAX_WORKERS = 32  # 批量执行时的最大并发设备数
+
+# 设备数据库连接参数：WAL日志 + NORMAL同步，64MB页缓存，256MB内存映射，临时表放内存
+# 注意：如需修改page_size，必须在启用WAL之前设置
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-65536",
+    "mmap_size=268435456",
+    "busy_timeout=60000",
+)
+SQLITE_CACHED_STATEMENTS = 128  # 连接内预编译语句缓存大小
+BULK_INSERT_BATCH_SIZE = 10000  # 批量导入时每个事务写入的行数
+
+# 密码掩码：对预先生成的星号串切片，超长密码才现场拼接
+_PASSWORD_MASK = '*' * 128
+
+
+def _mask_password(password: str) -> str:
+    """返回与密码等长的星号掩码"""
+    n = len(password)
+    return _PASSWORD_MASK[:n] if n <= len(_PASSWORD_MASK) else '*' * n
+
+# 设备表SQL语句，固定文本以便命中SQLite连接的语句缓存
+_DEVICE_COLUMNS = ("id", "host", "username", "password", "brand")
+SQL_GET_DEVICE = "SELECT id, host, username, password, brand FROM devices WHERE host = ?"
+SQL_GET_CREDENTIALS = "SELECT username, password, brand FROM devices WHERE host = ?"
+SQL_LIST_DEVICES = "SELECT id, host, username, password, brand FROM devices ORDER BY host"
+SQL_LIST_DEVICE_ROWS = "SELECT host, username, password, brand FROM devices ORDER BY host"
+# 子串匹配（关键字中的 % _ \ 已转义）；设备表很小，全表扫描即可
+SQL_SEARCH_DEVICES = (
+    "SELECT id, host, username, password, brand FROM devices "
+    "WHERE host LIKE ?1 ESCAPE '\\' OR username LIKE ?1 ESCAPE '\\' OR brand LIKE ?1 ESCAPE '\\' "
+    "ORDER BY host"
+)
+SQL_INSERT_DEVICE = "INSERT OR REPLACE INTO devices (host, username, password, brand) VALUES (?, ?, ?, ?)"
+SQL_UPDATE_DEVICE = "UPDATE devices SET {} WHERE host = ?"
+SQL_DELETE_DEVICE = "DELETE FROM devices WHERE host = ?"
+
+# 交互式shell读取参数
+SSH_SHELL_READ_TIMEOUT = 30  # 默认命令超时：连续这么久没有新输出才视为超时（秒），可用配置项command_timeout覆盖
+SSH_SHELL_POLL_INTERVAL = 0.05  # 无数据时的轮询间隔（秒）
+SSH_SHELL_SETTLE_INTERVAL = 0.3  # 登录横幅读取后等待输出静止的时间（秒）
+# 通用提示符模式只用于登录横幅，之后按实际提示符中的主机名匹配
+_SHELL_PROMPT_RE = re.compile(rb'[>#$%\]]\s*$')
+_SHELL_MORE_RE = re.compile(rb'[ \t]*(--\s*More\s*--|---- More ----|---\(more[^)]*\)---)\s*$')
+# 翻页后设备用于擦除分页提示的退格序列和光标移动控制码
+_SHELL_ERASE_RE = re.compile(rb'\x08+[ \t]*\x08*|\x1b\[[0-9;?]*[A-Za-z]')
+_SHELL_INPUT_RE = re.compile(rb'(?i)(?:password|passphrase)\s*:\s*$')
+
+# 打开shell后按品牌关闭分页，分页提示匹配只作为兜底
+_PAGING_OFF_COMMANDS = types.MappingProxyType({
+    "cisco": "terminal length 0",
+    "arista": "terminal length 0",
+    "juniper": "set cli screen-length 0",
+    "huawei": "screen-length 0 temporary",
+    "h3c": "screen-length disable",
+    "palo": "set cli pager off",
+})
+
+
+def _prompt_pattern(prompt: bytes) -> Optional["re.Pattern[bytes]"]:
+    """根据登录后的提示符生成匹配模式
+
+    只锚定主机名部分，模式切换引起的后缀变化（sw1> → sw1# → sw1(config)#，
+    <HW> → [HW-GigabitEthernet0/0/1]）仍能匹配，而配置输出中的 # 分隔行不会误判
+    """
+    base = prompt.strip().lstrip(b'<[').rstrip(b'>#$%]')
+    base = re.split(rb'[(:]', base, maxsplit=1)[0]
+    if not base:
+        return None
+    return re.compile(rb'[<\[]?' + re.escape(base) + rb'[^\r\n]*[>#$%\]][ \t]*')
+
+
+def _shell_text(data: bytes) -> str:
+    """去掉擦除序列后解码shell输出"""
+    return _SHELL_ERASE_RE.sub(b'', data).decode('utf-8', errors='ignore')
+
+
+class SSHShellError(Exception):
+    """shell未回到命令提示符（超时或设备在等待输入），output为已读取的部分输出"""
+    
+    def __init__(self, message: str, output: str = ""):
+        super().__init__(message)
+        self.output = output
+
+class SSHConnection:
+    """池化的SSH连接，在同一连接上保持一个交互式shell通道，使设备模式（如enable）在多条命令间保持"""
+    
+    def __init__(self, client: "paramiko.SSHClient"):
+        self.client = client
+        self._shell = None
+        self._prompt_re = None
+    
+    def is_alive(self) -> bool:
+        """检查连接是否仍然可用"""
+        transport = self.client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        if self._shell is not None and self._shell.closed:
+            self._shell = None
+        try:
+            transport.send_ignore()
+            return True
+        except Exception:
+            return False
+    
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+        self._shell = None
+    
+    def _ensure_shell(self, brand: str = "", timeout: float = SSH_SHELL_READ_TIMEOUT):
+        """打开shell通道（仅首次），丢弃登录横幅、记录设备的实际提示符并关闭分页"""
+        if self._shell is None or self._shell.closed:
+            self._shell = self.client.invoke_shell(width=512)
+            self._prompt_re = None
+            banner = self._read_until_prompt(timeout)
+            # 横幅可能分多次到达，等输出静止后以最后一个非空行作为提示符
+            banner += self._drain(SSH_SHELL_SETTLE_INTERVAL)
+            lines = [line for line in banner.replace("\r", "").split("\n") if line.strip()]
+            if lines:
+                self._prompt_re = _prompt_pattern(lines[-1].encode('utf-8'))
+            paging_off = _PAGING_OFF_COMMANDS.get(brand)
+            if paging_off:
+                self._shell.send(paging_off + "\n")
+                self._read_until_prompt(timeout)
+        return self._shell
+    
+    def _is_prompt(self, line: bytes) -> bool:
+        line = _SHELL_ERASE_RE.sub(b'', line)
+        if self._prompt_re is None:
+            return _SHELL_PROMPT_RE.search(line) is not None
+        return self._prompt_re.fullmatch(line.rstrip(b'\r')) is not None
+    
+    def _drain(self, quiet: float = 0.0) -> str:
+        """读出通道中已到达的数据；quiet>0时持续读取直到静止quiet秒"""
+        shell = self._shell
+        buf = bytearray()
+        idle_deadline = time.monotonic() + quiet
+        while True:
+            if shell.recv_ready():
+                chunk = shell.recv(65535)
+                if not chunk:
+                    break
+                buf += chunk
+                idle_deadline = time.monotonic() + quiet
+            elif time.monotonic() >= idle_deadline or shell.closed:
+                break
+            else:
+                time.sleep(SSH_SHELL_POLL_INTERVAL)
+        return _shell_text(bytes(buf))
+    
+    def _read_until_prompt(self, timeout: float = SSH_SHELL_READ_TIMEOUT) -> str:
+        """读取shell输出直到最后一行是命令提示符或通道关闭
+
+        timeout为无输出的最长时间，持续输出的长命令（如show tech-support）不会超时；
+        超时或设备提示输入密码时抛出SSHShellError，不把不完整的输出当作结果返回
+        """
+        shell = self._shell
+        buf = bytearray()
+        deadline = time.monotonic() + timeout
+        while True:
+            if shell.recv_ready():
+                chunk = shell.recv(65535)
+                if not chunk:
+                    break
+                buf += chunk
+                deadline = time.monotonic() + timeout
+                tail = bytes(buf[-64:])
+                # 分页输出时去掉分页提示并自动翻页
+                more = _SHELL_MORE_RE.search(tail)
+                if more:
+                    del buf[len(buf) - len(tail) + more.start():]
+                    shell.send(" ")
+                    continue
+                if self._is_prompt(bytes(buf[buf.rfind(b'\n') + 1:])):
+                    break
+                if _SHELL_INPUT_RE.search(tail):
+                    raise SSHShellError("设备正在等待输入（如enable密码），后续命令未执行",
+                                        _shell_text(bytes(buf)))
+            elif shell.closed or shell.exit_status_ready():
+                break
+            elif time.monotonic() >= deadline:
+                raise SSHShellError(f"{timeout}秒内没有等到命令提示符，输出可能不完整",
+                                    _shell_text(bytes(buf)))
+            else:
+                time.sleep(SSH_SHELL_POLL_INTERVAL)
+        return _shell_text(bytes(buf))
+    
+    def run(self, command: str, brand: str = "", timeout: float = SSH_SHELL_READ_TIMEOUT) -> str:
+        """在shell通道中执行一条命令，返回去掉回显和提示符后的输出
+
+        brand用于首次打开shell时关闭分页，timeout为无输出的最长等待时间（秒）
+        """
+        shell = self._ensure_shell(brand, timeout)
+        # 丢弃上一条命令残留的输出，避免混入本次结果
+        self._drain()
+        shell.send(command + "\n")
+        lines = self._read_until_prompt(timeout).replace("\r", "").split("\n")
+        if lines and lines[0].strip().endswith(command.strip()):
+            lines = lines[1:]
+        if lines and self._is_prompt(lines[-1].encode('utf-8')):
+            lines = lines[:-1]
+        return "\n".join(lines)
+
+def _pool_key(host: str, port: int, username: str, password: str) -> Tuple[str, int, str, bytes]:
+    """连接池键：包含密码摘要，密码变化后不会复用按旧密码认证的连接（不保存明文）"""
+    digest = hashlib.blake2b((password or "").encode(), digest_size=8).digest()
+    return (host, port, username, digest)
+
+class SSHConnectionPool:
+    """SSH连接池，按 (host, port, username, 密码摘要) 复用已认证的连接"""
+    
+    _instance = None
+    _instance_lock = threading.Lock()
+    
+    def __init__(self, idle_timeout: float = CONNECTION_POOL_IDLE_TIMEOUT,
+                 max_connections: int = CONNECTION_POOL_MAX_CONNECTIONS):
+        self.idle_timeout = idle_timeout
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        # (host, port, username, 密码摘要) -> (SSHConnection, 最后使用时间)，按最近使用顺序排列
+        self._connections: "OrderedDict[Tuple[str, int, str, bytes], Tuple[SSHConnection, float]]" = OrderedDict()
+        self._reaper = None
+        self._stop_event = threading.Event()
+    
+    @classmethod
+    def instance(cls) -> "SSHConnectionPool":
+        """获取全局连接池实例"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+                    atexit.register(cls._instance.close_all)
+        return cls._instance
+    
+    def acquire(self, host: str, port: int, username: str, password: str,
+                timeout: int = 10) -> SSHConnection:
+        """获取一个已连接的SSH连接，优先复用池中的空闲连接"""
+        key = _pool_key(host, port, username, password)
+        with self._lock:
+            entry = self._connections.pop(key, None)
+        
+        if entry is not None:
+            conn = entry[0]
+            if conn.is_alive():
+                return conn
+            conn.close()
+        
+        return self.connect(host, port, username, password, timeout)
+    
+    def connect(self, host: str, port: int, username: str, password: str,
+                timeout: int = 10) -> SSHConnection:
+        """新建并认证一个SSH连接，不复用池中的连接"""
+        paramiko = _paramiko()
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        # 让paramiko自动处理认证类型
+        client.connect(host, port=port, username=username, password=password, timeout=timeout)
+        transport = client.get_transport()
+        if transport is not None:
+            transport.set_keepalive(SSH_KEEPALIVE_INTERVAL)
+        
+        self._ensure_reaper()
+        return SSHConnection(client)
+    
+    def release(self, host: str, port: int, username: str, password: str, conn: SSHConnection):
+        """将连接归还到连接池，超出容量时按LRU淘汰"""
+        key = _pool_key(host, port, username, password)
+        stale = []
+        with self._lock:
+            # 同一账号按其他密码认证的连接已过时，一并关闭
+            for other in [k for k in self._connections if k[:3] == key[:3]]:
+                stale.append(self._connections.pop(other)[0])
+            self._connections[key] = (conn, time.monotonic())
+            while len(self._connections) > self.max_connections:
+                _, (evicted, _) = self._connections.popitem(last=False)
+                stale.append(evicted)
+        
+        for old_conn in stale:
+            old_conn.close()
+    
+    def discard(self, conn: SSHConnection):
+        """丢弃出错的连接"""
+        conn.close()
+    
+    def close_all(self):
+        """关闭连接池中的所有连接"""
+        self._stop_event.set()
+        with self._lock:
+            conns = [conn for conn, _ in self._connections.values()]
+            self._connections.clear()
+        for conn in conns:
+            conn.close()
+    
+    def _ensure_reaper(self):
+        """按需启动空闲连接回收线程"""
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+        with self._lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name="ssh-pool-reaper", daemon=True)
+            self._reaper.start()
+    
+    def _reap_loop(self):
+        interval = max(1.0, min(self.idle_timeout / 2, 60.0))
+        while not self._stop_event.wait(interval):
+            self.reap_idle()
+    
+    def reap_idle(self):
+        """关闭空闲时间超过 idle_timeout 的连接"""
+        deadline = time.monotonic() - self.idle_timeout
+        expired = []
+        with self._lock:
+            for key, (conn, last_used) in list(self._connections.items()):
+                if last_used < deadline:
+                    expired.append(conn)
+                    del self._connections[key]
+        for conn in expired:
+            conn.close()
+
+@functools.lru_cache(maxsize=1)
+def _sm_cli_md_text() -> Optional[str]:
+    """读取SM-CLI.md内容（进程内只读取一次），文件不存在时返回None"""
+    prompt_file = Path(__file__).parent / "SM-CLI.md"
+    if not prompt_file.exists():
+        return None
+    return prompt_file.read_bytes().decode('utf-8')
+
+# 品牌名称到SM-CLI.md章节标题的映射（只读）
+_BRAND_MAP = types.MappingProxyType({
+    "cisco": "Cisco设备",
+    "arista": "Arista设备",
+    "juniper": "Juniper设备",
+    "huawei": "Huawei设备",
+    "h3c": "H3C设备",
+    "fortinet": "Fortinet设备",
+    "palo": "Palo Alto设备"
+})
+_BRAND_BY_SECTION = types.MappingProxyType({section: brand for brand, section in _BRAND_MAP.items()})
+
+# SM-CLI.md中的品牌章节标题与字段行
+_BRAND_SECTION_RE = re.compile(r'^####\s+(.+?)设备\s*$', re.M)
+_BRAND_FIELD_RE = re.compile(r'^- \*\*(命令风格|模式切换|常用命令|配置保存|特色功能)\*\*:\s*(.+?)\s*$', re.M)
 
 class SSHCommandTool(Tool):
     name = "ssh_command"
@@ -60,121 +440,79 @@ class SSHCommandTool(Tool):
         self.config_manager = config_manager
         self.device_db = device_db
     
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def _load_brand_table(cls) -> Dict[str, str]:
+        """读取并解析SM-CLI.md，返回 品牌(小写) -> 命令建议 的映射，每个进程只解析一次"""
+        content = _sm_cli_md_text()
+        if content is None:
+            return {}
+        return cls.parse_brand_commands(content)
+    
     def get_brand_commands_from_prompt(self, brand):
         """从系统提示词中获取品牌命令建议"""
         try:
-            # 加载系统提示词
-            prompt_file = Path(__file__).parent / "SM-CLI.md"
-            if not prompt_file.exists():
-                return None
-            
-            with open(prompt_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 解析品牌命令信息
-            brand_commands = self.parse_brand_commands(content, brand)
-            return brand_commands
-            
-        except Exception as e:
+            return self._load_brand_table().get(brand.lower())
+        except (OSError, UnicodeDecodeError) as e:
             print(f"⚠️  解析品牌命令失败: {e}")
             return None
     
-    def parse_brand_commands(self, content, brand):
-        """解析系统提示词中的品牌命令信息"""
-        try:
-            # 品牌名称映射
-            brand_mapping = {
-                "cisco": "Cisco设备",
-                "arista": "Arista设备", 
-                "juniper": "Juniper设备",
-                "huawei": "Huawei设备",
-                "h3c": "H3C设备",
-                "fortinet": "Fortinet设备",
-                "palo": "Palo Alto设备"
-            }
-            
-            brand_section = brand_mapping.get(brand.lower())
-            if not brand_section:
-                return None
+    @staticmethod
+    def parse_brand_commands(content: str) -> Dict[str, str]:
+        """解析系统提示词中所有品牌章节，返回 品牌(小写) -> 命令建议"""
+        # 按品牌章节切分: [前言, 品牌1, 内容1, 品牌2, 内容2, ...]
+        parts = _BRAND_SECTION_RE.split(content)
+        table = {}
+        for name, body in zip(parts[1::2], parts[2::2]):
+            brand = _BRAND_BY_SECTION.get(f"{name}设备")
+            if brand is None or brand in table:
+                continue
             
-            # 查找品牌对应的章节
-            lines = content.split('\n')
-            in_brand_section = False
-            brand_info = {}
-            
-            for line in lines:
-                line = line.strip()
-                
-                # 检查是否进入目标品牌章节
-                if line.startswith(f"#### {brand_section}"):
-                    in_brand_section = True
-                    continue
-                
-                # 如果遇到下一个品牌章节，停止解析
-                if in_brand_section and line.startswith("#### ") and not line.startswith(f"#### {brand_section}"):
-                    break
-                
-                # 在目标品牌章节中查找各种信息
-                if in_brand_section:
-                    if line.startswith("- **命令风格**: "):
-                        brand_info['command_style'] = line.replace("- **命令风格**: ", "")
-                    elif line.startswith("- **模式切换**: "):
-                        brand_info['mode_switch'] = line.replace("- **模式切换**: ", "")
-                    elif line.startswith("- **常用命令**: "):
-                        commands_text = line.replace("- **常用命令**: ", "")
-                        command_list = [cmd.strip() for cmd in commands_text.split(',')]
-                        brand_info['common_commands'] = command_list
-                    elif line.startswith("- **配置保存**: "):
-                        brand_info['config_save'] = line.replace("- **配置保存**: ", "")
-                    elif line.startswith("- **特色功能**: "):
-                        brand_info['special_features'] = line.replace("- **特色功能**: ", "")
-            
-            # 构建建议信息
+            brand_info = dict(_BRAND_FIELD_RE.findall(body))
             suggestions = []
             
             # 添加模式切换信息
-            if 'mode_switch' in brand_info:
-                suggestions.append(f"模式切换: {brand_info['mode_switch']}")
+            if '模式切换' in brand_info:
+                suggestions.append(f"模式切换: {brand_info['模式切换']}")
             
             # 添加常用命令
-            if 'common_commands' in brand_info:
+            if '常用命令' in brand_info:
                 suggestions.append("常用命令:")
-                for cmd in brand_info['common_commands']:
+                for cmd in brand_info['常用命令'].split(','):
+                    cmd = cmd.strip()
                     if cmd:
                         suggestions.append(f"  - {cmd}")
             
             # 添加配置保存信息
-            if 'config_save' in brand_info:
-                suggestions.append(f"配置保存: {brand_info['config_save']}")
+            if '配置保存' in brand_info:
+                suggestions.append(f"配置保存: {brand_info['配置保存']}")
             
             # 添加特色功能
-            if 'special_features' in brand_info:
-                suggestions.append(f"特色功能: {brand_info['special_features']}")
+            if '特色功能' in brand_info:
+                suggestions.append(f"特色功能: {brand_info['特色功能']}")
             
             if suggestions:
-                return "\n".join(suggestions)
-            else:
-                return None
-                
-        except Exception as e:
-            print(f"⚠️  解析品牌命令失败: {e}")
-            return None
+                table[brand] = "\n".join(suggestions)
+        
+        return table
 
     def forward(self, host: str, username: str = "", password: str = "", command: str = "", 
                 port: int = 22) -> str:
+        paramiko = _paramiko()
         try:
             # 必须从数据库获取设备信息
-            device_info = None
+            credentials = None
             if self.device_db:
-                device_info = self.device_db.get_device(host=host)
+                credentials = self.device_db.get_credentials(host)
             
-            if not device_info:
+            if not credentials:
                 return f"❌ 设备 '{host}' 未在数据库中找到，请先使用 /add_device 添加设备"
             
             # 使用数据库中的信息
-            username = username or device_info.get("username", "admin")
-            password = password or device_info.get("password", "")
-            brand = device_info.get("brand", "Unknown").lower()
+            db_username, db_password, brand = credentials
+            username = username or db_username
+            password = password or db_password
+            brand = brand.lower()
             
             # 如果命令为空，根据品牌提供建议
             if not command:
@@ -185,19 +523,32 @@ class SSHCommandTool(Tool):
                 else:
                     return f"设备 {host} 品牌未知 ({brand})，建议使用通用命令：show version, show interfaces, show running-config"
             
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # 让paramiko自动处理认证类型
-            ssh.connect(host, port=port, username=username, password=password, timeout=10)
+            # 连接超时和命令超时（无输出的最长时间）取自配置
+            config = self.config_manager
+            connect_timeout = config.get("timeout", 10) if config else 10
+            command_timeout = config.get("command_timeout", SSH_SHELL_READ_TIMEOUT) if config else SSH_SHELL_READ_TIMEOUT
             
-            stdin, stdout, stderr = ssh.exec_command(command)
-            result = stdout.read().decode(errors="ignore")
-            error = stderr.read().decode(errors="ignore")
-            ssh.close()
-            
-            if error:
-                return f"命令执行结果:\n{result}\n\n错误信息:\n{error}"
+            # 从连接池获取连接，避免每次命令都重新握手认证
+            pool = SSHConnectionPool.instance()
+            ssh = pool.acquire(host, port, username, password, connect_timeout)
+            outputs = []
+            try:
+                # 多行命令逐条写入同一个shell通道，enable等模式切换对后续命令持续有效
+                # （pty通道中stderr已与stdout合并）
+                for line in command.split("\n"):
+                    if line.strip():
+                        outputs.append(ssh.run(line, brand, command_timeout))
+            except SSHShellError as e:
+                # shell状态已不确定，丢弃连接，返回已有输出并注明原因
+                pool.discard(ssh)
+                outputs.append(e.output.replace("\r", ""))
+                outputs.append(f"⚠️  {e}")
+            except Exception:
+                pool.discard(ssh)
+                raise
+            else:
+                pool.release(host, port, username, password, ssh)
+            result = "\n".join(output for output in outputs if output)
             
             # 在结果前添加设备品牌信息，帮助AI更好地理解结果
             brand_info = f"[设备品牌: {brand.upper()}] "
@@ -233,28 +584,26 @@ class SSHTestTool(Tool):
 
     def forward(self, host: str, username: str = "", password: str = "", 
                 port: int = 22) -> str:
+        paramiko = _paramiko()
         try:
             # 必须从数据库获取设备信息
-            device_info = None
+            credentials = None
             if self.device_db:
-                device_info = self.device_db.get_device(host=host)
+                credentials = self.device_db.get_credentials(host)
             
-            if not device_info:
+            if not credentials:
                 return f"❌ 设备 '{host}' 未在数据库中找到，请先使用 /add_device 添加设备"
             
             # 使用数据库中的信息
-            username = username or device_info.get("username", "admin")
-            password = password or device_info.get("password", "")
-            brand = device_info.get("brand", "Unknown")
-            
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # 参考test3.py的成功连接方式
-            ssh.connect(host, port=port, username=username, password=password, timeout=10)
+            db_username, db_password, brand = credentials
+            username = username or db_username
+            password = password or db_password
             
-            # 测试连接后立即关闭，不执行任何命令
-            ssh.close()
+            # 参考test3.py的成功连接方式；总是重新认证以真正验证凭据，成功后归还连接池供后续命令复用
+            pool = SSHConnectionPool.instance()
+            connect_timeout = self.config_manager.get("timeout", 10) if self.config_manager else 10
+            ssh = pool.connect(host, port, username, password, connect_timeout)
+            pool.release(host, port, username, password, ssh)
             
             return f"""✅ SSH连接成功！
 
@@ -282,6 +631,44 @@ class SSHTestTool(Tool):
         except Exception as e:
             return f"❌ 连接测试失败: {e}"
 
+class SSHBatchTool(Tool):
+    name = "ssh_batch_command"
+    description = (
+        "在多台网络设备上并发执行同一条命令，返回每台设备的结果。"
+        "适用于需要对多台设备进行巡检或收集信息的场景，比逐台调用ssh_command快得多。"
+        "参数：hosts（设备IP或设备名称列表，为空时对数据库中的所有设备执行），command（要执行的命令）。"
+        "示例：ssh_batch_command(hosts=['172.21.1.167', '172.21.1.81'], command='show version')"
+        "\n\n命令格式与ssh_command相同，特权命令同样需要 'enable\\n目标命令' 的形式。"
+    )
+    inputs = {
+        "hosts": {"type": "array", "description": "设备IP地址或设备名称列表，为空时表示所有设备", "nullable": True},
+        "command": {"type": "string", "description": "要在每台设备上执行的命令", "nullable": True},
+        "port": {"type": "integer", "description": "SSH端口号", "default": 22, "nullable": True}
+    }
+    output_type = "string"
+
+    def __init__(self, config_manager=None, device_db=None, ssh_tool=None):
+        super().__init__()
+        self.config_manager = config_manager
+        self.device_db = device_db
+        self.ssh_tool = ssh_tool or SSHCommandTool(config_manager, device_db)
+
+    def forward(self, hosts: list = None, command: str = "", port: int = 22) -> str:
+        if not hosts and self.device_db:
+            hosts = [row[0] for row in self.device_db.list_device_rows()]
+        # 去重后每台设备只占用一个并发任务，避免同时向同一设备建立多条连接
+        hosts = list(dict.fromkeys(hosts or []))
+        if not hosts:
+            return "❌ 没有可执行命令的设备，请先使用 /add_device 添加设备"
+        
+        port = port or 22
+        max_workers = min(SSH_BATCH_MAX_WORKERS, len(hosts))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ssh-batch") as executor:
+            results = executor.map(lambda host: self.ssh_tool.forward(host, command=command, port=port), hosts)
+            sections = [f"===== {host} =====\n{result}" for host, result in zip(hosts, results)]
+        
+        return "\n\n".join(sections)
+
 class DeviceDatabase:
     """设备数据库管理器"""
     
@@ -294,16 +681,63 @@ class DeviceDatabase:
             self.db_path = Path(db_path)
         
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # 整个生命周期复用同一个连接，事务由 _transaction 显式管理
+        self._lock = threading.RLock()
+        # host -> 设备信息（None表示设备不存在），写操作时失效
+        self._device_cache: Dict[str, Optional[Dict]] = {}
+        # host -> (用户名, 密码, 品牌)，SSH工具的热路径只需要这三项
+        self._credentials_cache: Dict[str, Optional[Tuple[str, str, str]]] = {}
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None,
+                                     cached_statements=SQLITE_CACHED_STATEMENTS)
+        for pragma in SQLITE_PRAGMAS:
+            self._conn.execute(f"PRAGMA {pragma}")
+        atexit.register(self.close)
+        
         self.init_database()
     
+    @contextmanager
+    def _transaction(self):
+        """在锁保护下执行显式事务"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                # COMMIT失败（如磁盘已满）时同样回滚，避免连接一直停留在事务中
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.execute("PRAGMA optimize")
+                except sqlite3.Error:
+                    pass
+                self._conn.close()
+                self._conn = None
+            self.clear_cache()
+    
+    def clear_cache(self):
+        """清空内存中的设备信息和凭据缓存"""
+        with self._lock:
+            self._device_cache.clear()
+            self._credentials_cache.clear()
+    
+    def _invalidate(self, host: str):
+        self._device_cache.pop(host, None)
+        self._credentials_cache.pop(host, None)
+    
     def init_database(self):
         """初始化数据库表"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
+            with self._transaction() as conn:
                 # 创建设备表 - 包含IP、用户名、密码和品牌
-                cursor.execute('''
+                conn.execute('''
                     CREATE TABLE IF NOT EXISTS devices (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         host TEXT NOT NULL UNIQUE,
@@ -314,120 +748,144 @@ class DeviceDatabase:
                 ''')
                 
                 # 检查是否需要添加品牌字段（数据库迁移）
-                cursor.execute("PRAGMA table_info(devices)")
-                columns = [column[1] for column in cursor.fetchall()]
+                columns = [column[1] for column in conn.execute("PRAGMA table_info(devices)").fetchall()]
                 if 'brand' not in columns:
-                    cursor.execute("ALTER TABLE devices ADD COLUMN brand TEXT DEFAULT 'Unknown'")
+                    conn.execute("ALTER TABLE devices ADD COLUMN brand TEXT DEFAULT 'Unknown'")
                     print("✅ 数据库已更新：添加品牌字段")
                 
-                conn.commit()
+                # host上的UNIQUE约束已提供精确查找索引，这里补充前缀搜索用的NOCASE索引
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_host_nocase ON devices(host COLLATE NOCASE)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_username ON devices(username)")
                 
-        except Exception as e:
+        except sqlite3.Error as e:
             print(f"❌ 数据库初始化失败: {e}")
     
     def add_device(self, host: str, username: str, password: str, brand: str = "Unknown") -> bool:
         """添加设备"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT OR REPLACE INTO devices 
-                    (host, username, password, brand)
-                    VALUES (?, ?, ?, ?)
-                ''', (host, username, password, brand))
-                conn.commit()
+            with self._transaction() as conn:
+                conn.execute(SQL_INSERT_DEVICE, (host, username, password, brand))
+                self._invalidate(host)
                 return True
-        except Exception as e:
+        except sqlite3.Error as e:
             print(f"❌ 添加设备失败: {e}")
             return False
     
-    def get_device(self, host: str) -> Optional[Dict]:
-        """获取设备信息"""
+    def add_devices(self, rows: Iterable[Tuple[str, str, str, str]],
+                    batch_size: int = BULK_INSERT_BATCH_SIZE) -> int:
+        """批量添加设备 (host, username, password, brand)，每batch_size行一个事务，返回写入行数"""
+        count = 0
+        rows = iter(rows)
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM devices WHERE host = ?', (host,))
-                row = cursor.fetchone()
-                if row:
-                    columns = [description[0] for description in cursor.description]
-                    return dict(zip(columns, row))
-                return None
-        except Exception as e:
-            print(f"❌ 获取设备失败: {e}")
-            return None
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                with self._transaction() as conn:
+                    conn.executemany(SQL_INSERT_DEVICE, batch)
+                count += len(batch)
+            
+            if count:
+                with self._lock:
+                    self._conn.execute("ANALYZE")
+        except sqlite3.Error as e:
+            print(f"❌ 批量添加设备失败: {e}")
+        finally:
+            self.clear_cache()
+        return count
+    
+    def get_device(self, host: str) -> Optional[Dict]:
+        """获取设备信息（热路径，数据库异常由调用方处理）"""
+        with self._lock:
+            if host in self._device_cache:
+                return self._device_cache[host]
+            
+            row = self._conn.execute(SQL_GET_DEVICE, (host,)).fetchone()
+            device = dict(zip(_DEVICE_COLUMNS, row)) if row else None
+            self._device_cache[host] = device
+            return device
+    
+    def get_credentials(self, host: str) -> Optional[Tuple[str, str, str]]:
+        """获取设备登录凭据 (username, password, brand)，设备不存在时返回None"""
+        with self._lock:
+            if host in self._credentials_cache:
+                return self._credentials_cache[host]
+            
+            row = self._conn.execute(SQL_GET_CREDENTIALS, (host,)).fetchone()
+            credentials = (row[0], row[1], row[2] or "Unknown") if row else None
+            self._credentials_cache[host] = credentials
+            return credentials
     
     def list_devices(self) -> List[Dict]:
         """列出所有设备"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM devices ORDER BY host')
-                rows = cursor.fetchall()
-                
-                columns = [description[0] for description in cursor.description]
-                return [dict(zip(columns, row)) for row in rows]
-        except Exception as e:
+            with self._lock:
+                rows = self._conn.execute(SQL_LIST_DEVICES).fetchall()
+                devices = [dict(zip(_DEVICE_COLUMNS, row)) for row in rows]
+                self._device_cache.update((device['host'], device) for device in devices)
+                return devices
+        except sqlite3.Error as e:
+            print(f"❌ 列出设备失败: {e}")
+            return []
+    
+    def list_device_rows(self) -> List[Tuple[str, str, str, str]]:
+        """以 (host, username, password, brand) 元组列出所有设备，供批量显示使用"""
+        try:
+            with self._lock:
+                return self._conn.execute(SQL_LIST_DEVICE_ROWS).fetchall()
+        except sqlite3.Error as e:
             print(f"❌ 列出设备失败: {e}")
             return []
     
     def update_device(self, host: str, username: str = None, password: str = None, brand: str = None) -> bool:
         """更新设备信息"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                updates = []
-                params = []
-                
-                if username:
-                    updates.append('username = ?')
-                    params.append(username)
-                if password:
-                    updates.append('password = ?')
-                    params.append(password)
-                if brand:
-                    updates.append('brand = ?')
-                    params.append(brand)
-                
-                if not updates:
-                    return False
-                
-                params.append(host)
-                cursor.execute(f'UPDATE devices SET {", ".join(updates)} WHERE host = ?', params)
-                
-                conn.commit()
+            updates = []
+            params = []
+            
+            if username:
+                updates.append('username = ?')
+                params.append(username)
+            if password:
+                updates.append('password = ?')
+                params.append(password)
+            if brand:
+                updates.append('brand = ?')
+                params.append(brand)
+            
+            if not updates:
+                return False
+            
+            params.append(host)
+            with self._transaction() as conn:
+                cursor = conn.execute(SQL_UPDATE_DEVICE.format(", ".join(updates)), params)
+                self._invalidate(host)
                 return cursor.rowcount > 0
-        except Exception as e:
+        except sqlite3.Error as e:
             print(f"❌ 更新设备失败: {e}")
             return False
     
     def delete_device(self, host: str) -> bool:
         """删除设备"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('DELETE FROM devices WHERE host = ?', (host,))
-                conn.commit()
+            with self._transaction() as conn:
+                cursor = conn.execute(SQL_DELETE_DEVICE, (host,))
+                self._invalidate(host)
                 return cursor.rowcount > 0
-        except Exception as e:
+        except sqlite3.Error as e:
             print(f"❌ 删除设备失败: {e}")
             return False
     
     def search_devices(self, keyword: str) -> List[Dict]:
         """搜索设备"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT * FROM devices 
-                    WHERE host LIKE ? OR username LIKE ?
-                    ORDER BY host
-                ''', (f'%{keyword}%', f'%{keyword}%'))
-                rows = cursor.fetchall()
-                
-                columns = [description[0] for description in cursor.description]
-                return [dict(zip(columns, row)) for row in rows]
-        except Exception as e:
+            with self._lock:
+                pattern = keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                rows = self._conn.execute(SQL_SEARCH_DEVICES, (f'%{pattern}%',)).fetchall()
+                devices = [dict(zip(_DEVICE_COLUMNS, row)) for row in rows]
+                self._device_cache.update((device['host'], device) for device in devices)
+                return devices
+        except sqlite3.Error as e:
             print(f"❌ 搜索设备失败: {e}")
             return []
 
@@ -441,6 +899,8 @@ class ConfigManager:
             self.config_path = Path(config_path)
         
         self.config_path.parent.mkdir(parents=True, exist_ok=True)
+        # 最近一次写入磁盘的配置摘要，用于跳过未变化的保存
+        self._last_saved_digest: Optional[bytes] = None
         self.config = self.load_config()
     
     def load_config(self) -> Dict[str, Any]:
@@ -448,8 +908,10 @@ class ConfigManager:
         if self.config_path.exists():
             try:
                 with open(self.config_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
+                    config = json.load(f)
+                self._last_saved_digest = self._digest(self._serialize(config))
+                return config
+            except (OSError, ValueError) as e:
                 print(f"⚠️  配置文件加载失败: {e}")
                 return self.get_default_config()
         return self.get_default_config()
@@ -458,6 +920,7 @@ class ConfigManager:
         """获取默认配置"""
         return {
             "timeout": 10,
+            "command_timeout": SSH_SHELL_READ_TIMEOUT,  # 设备连续无输出超过该秒数视为命令超时
             "max_steps": 10,  # AI代理最大执行步数，防止无限循环
             "available_models": {
                 "deepseek": {
@@ -494,13 +957,44 @@ class ConfigManager:
             "current_model": "deepseek"
         }
     
+    @staticmethod
+    def _serialize(config: Dict[str, Any]) -> bytes:
+        """序列化配置为UTF-8 JSON"""
+        if orjson is not None:
+            return orjson.dumps(config, option=orjson.OPT_INDENT_2)
+        return json.dumps(config, indent=2, ensure_ascii=False).encode('utf-8')
+    
+    @staticmethod
+    def _digest(data: bytes) -> bytes:
+        return hashlib.blake2b(data, digest_size=16).digest()
+    
     def save_config(self):
-        """保存配置到文件"""
+        """保存配置到文件（内容未变化时跳过写入，先写临时文件再原子替换）"""
         try:
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
+            data = self._serialize(self.config)
+            digest = self._digest(data)
+            if digest == self._last_saved_digest and self.config_path.exists():
+                return True
+            
+            # 临时文件名唯一，多个实例同时保存不会互相覆盖；mkstemp创建的文件权限为0600
+            fd, tmp_path = tempfile.mkstemp(dir=self.config_path.parent,
+                                            prefix=self.config_path.name + '.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                # 配置中含API密钥，替换时保留原文件权限（如用户设置的600）
+                if self.config_path.exists():
+                    os.chmod(tmp_path, stat.S_IMODE(self.config_path.stat().st_mode))
+                os.replace(tmp_path, self.config_path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+            self._last_saved_digest = digest
             return True
-        except Exception as e:
+        except (OSError, TypeError, ValueError) as e:
             print(f"❌ 配置保存失败: {e}")
             return False
     
@@ -518,6 +1012,106 @@ class ConfigManager:
         self.config.update(updates)
         return self.save_config()
 
+def _build_title_lines() -> Tuple[str, ...]:
+    """生成像素化标题"SM-CLI"的各行（含颜色），仿照GEMINI样式"""
+    # 定义渐变色彩序列（从蓝色到紫色到粉红色）
+    colors = [
+        "\033[1;34m",   # 蓝色
+        "\033[1;35m",   # 紫色
+        "\033[1;95m",   # 亮紫色
+        "\033[1;91m",   # 亮红色
+        "\033[1;31m",   # 红色
+    ]
+    
+    # 定义像素化字母图案（每个字母7x9像素）
+    letters = {
+        'S': [
+            " ██████ ",
+            "██    ██",
+            "██      ",
+            " ██████ ",
+            "      ██",
+            "██    ██",
+            " ██████ "
+        ],
+        'M': [
+            "██     ██",
+            "███   ███",
+            "██ █ █ ██",
+            "██  █  ██",
+            "██     ██",
+            "██     ██",
+            "██     ██"
+        ],
+        '-': [
+            "         ",
+            "         ",
+            "         ",
+            " ███████ ",
+            "         ",
+            "         ",
+            "         "
+        ],
+        'C': [
+            "  ██████ ",
+            " ██    ██",
+            "██       ",
+            "██       ",
+            "██       ",
+            " ██    ██",
+            "  ██████ "
+        ],
+        'L': [
+            "██       ",
+            "██       ",
+            "██       ",
+            "██       ",
+            "██       ",
+            "██       ",
+            "█████████"
+        ],
+        'I': [
+            "█████████",
+            "    █    ",
+            "    █    ",
+            "    █    ",
+            "    █    ",
+            "    █    ",
+            "█████████"
+        ]
+    }
+    
+    title = "SM-CLI"
+    lines = []
+    for row in range(7):  # 7行像素
+        line = ""
+        for i, char in enumerate(title):
+            if char in letters:
+                # 根据位置选择颜色，创建渐变效果
+                color_index = min(i, len(colors) - 1)
+                color = colors[color_index]
+                
+                # 添加像素行
+                pixel_row = letters[char][row]
+                line += f"{color}{pixel_row}\033[0m"
+                
+                # 字母间添加空格
+                if i < len(title) - 1:
+                    line += " "
+            else:
+                # 对于空格或其他字符
+                line += "         "
+        lines.append(line)
+    return tuple(lines)
+
+# 标题内容固定，导入时生成一次
+_TITLE_LINES = _build_title_lines()
+_TITLE_CACHED = "\n".join(_TITLE_LINES) + "\n"
+
+# 输出被管道或重定向时不清屏、不输出颜色控制码
+_IS_TTY = sys.stdout.isatty()
+_ANSI_RE = re.compile(r'\033\[[0-9;]*[A-Za-z]')
+
 class SMCli:
     """SM-CLI 主类"""
     
@@ -525,27 +1119,50 @@ class SMCli:
         self.config_manager = ConfigManager()
         self.device_db = DeviceDatabase()
         self.agent = None
+        self._agent_sig: Optional[Tuple[str, str, bytes]] = None
         self.ssh_tool = SSHCommandTool(self.config_manager, self.device_db)
         self.ssh_test_tool = SSHTestTool(self.config_manager, self.device_db)
+        self.ssh_batch_tool = SSHBatchTool(self.config_manager, self.device_db, self.ssh_tool)
         self.running = True
-        self.setup_agent()
+        self._commands = self._build_command_table()
+        self._completion_matches: List[str] = []
+        # AI代理在收到第一条对话消息时才初始化，只使用命令时不加载LLM相关模块
     
     def load_system_prompt(self):
         """加载SM-CLI.md系统提示词"""
         try:
-            prompt_file = Path(__file__).parent / "SM-CLI.md"
-            if prompt_file.exists():
-                with open(prompt_file, 'r', encoding='utf-8') as f:
-                    return f.read()
+            content = _sm_cli_md_text()
+            if content is not None:
+                return content
             else:
                 print("⚠️  SM-CLI.md提示词文件未找到，使用默认提示词")
                 return "你是一位资深的网络设备专家，请帮助用户管理网络设备。"
-        except Exception as e:
+        except (OSError, UnicodeDecodeError) as e:
             print(f"⚠️  加载提示词文件失败: {e}，使用默认提示词")
             return "你是一位资深的网络设备专家，请帮助用户管理网络设备。"
     
+    @staticmethod
+    def _agent_signature(model_key: str, model_config: Dict[str, Any]) -> Tuple[str, str, bytes]:
+        """代理配置签名：只保存API密钥摘要，不保存明文"""
+        api_key = model_config.get("api_key") or ""
+        digest = hashlib.blake2b(api_key.encode(), digest_size=8).digest()
+        return (model_key, model_config.get("model_id", ""), digest)
+    
+    def _agent_is_current(self, model_key: str) -> bool:
+        """当前代理是否已按该模型的配置初始化"""
+        model_config = self.config_manager.get("available_models", {}).get(model_key)
+        return (self.agent is not None and model_config is not None
+                and self._agent_sig == self._agent_signature(model_key, model_config))
+    
+    def _invalidate_agent(self):
+        """丢弃当前代理，下一条对话消息时按最新配置重新初始化"""
+        self.agent = None
+        self._agent_sig = None
+    
     def setup_agent(self, model_key: str = None):
         """初始化AI代理"""
+        from smolagents import LiteLLMModel, CodeAgent
+        
         try:
             # 尝试禁用代理以避免SOCKS问题
             import os
@@ -593,6 +1210,7 @@ class SMCli:
                 else:
                     print(f"❌ 没有找到可用的模型，请使用 /set_model_key 设置API密钥")
                     self.agent = None
+                    self._agent_sig = None
                     return
             
             # 加载系统提示词
@@ -605,9 +1223,10 @@ class SMCli:
             
             # 直接创建CodeAgent，系统提示词通过其他方式集成
             self.agent = CodeAgent(
-                tools=[self.ssh_tool, self.ssh_test_tool],
+                tools=[self.ssh_tool, self.ssh_test_tool, self.ssh_batch_tool],
                 model=model
             )
+            self._agent_sig = self._agent_signature(model_key, model_config)
             print(f"✅ AI代理初始化成功 - 使用模型: {model_config['name']} ({model_id})")
             print(f"📋 已加载SM-CLI.md提示词规范")
             
@@ -632,9 +1251,10 @@ class SMCli:
                         api_key=api_key
                     )
                     self.agent = CodeAgent(
-                        tools=[self.ssh_tool, self.ssh_test_tool],
+                        tools=[self.ssh_tool, self.ssh_test_tool, self.ssh_batch_tool],
                         model=model
                     )
+                    self._agent_sig = self._agent_signature(model_key, model_config)
                     print(f"✅ AI代理重新初始化成功 - 使用模型: {model_config['name']} ({model_id})")
                     print("⚠️  注意: 由于网络问题，未加载SM-CLI.md提示词规范")
                     return
@@ -651,51 +1271,67 @@ class SMCli:
             if original_all_proxy:
                 os.environ['all_proxy'] = original_all_proxy
     
+    # 帮助信息在类定义时一次性拼好，print_help只需一次写出
+    _HELP_RULE = "\033[1;37m" + "=" * 60 + "\033[0m\n"
+    _HELP_TEXT = "".join((
+        _HELP_RULE,
+        "\033[1;36mSM-CLI 命令帮助\033[0m\n",
+        _HELP_RULE,
+        "\n",
+        "\033[1;33m基本命令:\033[0m\n",
+        "  \033[0;37m/help, /h          - 显示此帮助信息\033[0m\n",
+        "  \033[0;37m/quit, /q, /exit   - 退出程序\033[0m\n",
+        "  \033[0;37m/clear, /cls       - 清屏\033[0m\n",
+        "  \033[0;37m/status            - 显示当前配置状态\033[0m\n",
+        "\n",
+        "\033[1;33m配置命令:\033[0m\n",
+        "  \033[0;37m/config            - 显示所有配置\033[0m\n",
+        "  \033[0;37m/step              - 显示/设置AI最大步数\033[0m\n",
+        "  \033[0;37m/reset             - 重置为默认配置\033[0m\n",
+        "\n",
+        "\033[1;33m设备管理命令:\033[0m\n",
+        "  \033[0;37m/devices           - 列出所有设备\033[0m\n",
+        "  \033[0;37m/add_device        - 添加设备\033[0m\n",
+        "  \033[0;37m/del_device        - 删除设备\033[0m\n",
+        "  \033[0;37m/search_device     - 搜索设备\033[0m\n",
+        "  \033[0;37m/update_brand      - 更新设备品牌\033[0m\n",
+        "\n",
+        "\033[1;33mLLM模型管理命令:\033[0m\n",
+        "  \033[0;37m/llm               - 列出所有可用模型\033[0m\n",
+        "  \033[0;37m/switch_llm        - 切换当前模型\033[0m\n",
+        "  \033[0;37m/set_model_key     - 设置模型API密钥\033[0m\n",
+        "  \033[0;37m/current_llm       - 显示当前模型\033[0m\n",
+        "\n",
+        "\033[1;33m使用示例:\033[0m\n",
+        "  \033[0;37m/llm                    - 查看可用模型\033[0m\n",
+        "  \033[0;37m/set_model_key gpt-4 sk-your-key\033[0m\n",
+        "  \033[0;37m/switch_llm gpt-4       - 切换到GPT-4\033[0m\n",
+        "  \033[0;37m/step 20                - 设置AI最大步数为20\033[0m\n",
+        "  \033[0;37m/add_device 172.21.1.167 admin r00tme Arista\033[0m\n",
+        "  \033[0;37m/update_brand 172.21.1.167 Arista\033[0m\n",
+        "  \033[0;37m/devices\033[0m\n",
+        "\n",
+        _HELP_RULE,
+    ))
+    
+    # 状态信息模板，print_status填入动态值后一次写出
+    _STATUS_RULE = "\033[1;37m" + "=" * 50 + "\033[0m\n"
+    _STATUS_TEMPLATE = (
+        _STATUS_RULE
+        + "\033[1;36m当前配置状态\033[0m\n"
+        + _STATUS_RULE
+        + "\033[1;33mAPI密钥:\033[0m {api_key_status}\n"
+        + "\033[1;33m模型ID:\033[0m \033[0;37m{model_id}\033[0m\n"
+        + "\033[1;33m当前模型:\033[0m \033[0;37m{model_name}\033[0m\n"
+        + "\033[1;33mAI max_steps:\033[0m \033[0;37m{max_steps}\033[0m\n"
+        + _STATUS_RULE
+        + "\n"
+    )
+    
     def print_help(self):
         """打印帮助信息"""
-        print("\033[1;37m" + "=" * 60 + "\033[0m")
-        print("\033[1;36mSM-CLI 命令帮助\033[0m")
-        print("\033[1;37m" + "=" * 60 + "\033[0m")
-        print()
-        
-        print("\033[1;33m基本命令:\033[0m")
-        print("  \033[0;37m/help, /h          - 显示此帮助信息\033[0m")
-        print("  \033[0;37m/quit, /q, /exit   - 退出程序\033[0m")
-        print("  \033[0;37m/clear, /cls       - 清屏\033[0m")
-        print("  \033[0;37m/status            - 显示当前配置状态\033[0m")
-        print()
-        
-        print("\033[1;33m配置命令:\033[0m")
-        print("  \033[0;37m/config            - 显示所有配置\033[0m")
-        print("  \033[0;37m/step              - 显示/设置AI最大步数\033[0m")
-        print("  \033[0;37m/reset             - 重置为默认配置\033[0m")
-        print()
-        
-        print("\033[1;33m设备管理命令:\033[0m")
-        print("  \033[0;37m/devices           - 列出所有设备\033[0m")
-        print("  \033[0;37m/add_device        - 添加设备\033[0m")
-        print("  \033[0;37m/del_device        - 删除设备\033[0m")
-        print("  \033[0;37m/search_device     - 搜索设备\033[0m")
-        print("  \033[0;37m/update_brand      - 更新设备品牌\033[0m")
-        print()
-        
-        print("\033[1;33mLLM模型管理命令:\033[0m")
-        print("  \033[0;37m/llm               - 列出所有可用模型\033[0m")
-        print("  \033[0;37m/switch_llm        - 切换当前模型\033[0m")
-        print("  \033[0;37m/set_model_key     - 设置模型API密钥\033[0m")
-        print("  \033[0;37m/current_llm       - 显示当前模型\033[0m")
-        print()
-        
-        print("\033[1;33m使用示例:\033[0m")
-        print("  \033[0;37m/llm                    - 查看可用模型\033[0m")
-        print("  \033[0;37m/set_model_key gpt-4 sk-your-key\033[0m")
-        print("  \033[0;37m/switch_llm gpt-4       - 切换到GPT-4\033[0m")
-        print("  \033[0;37m/step 20                - 设置AI最大步数为20\033[0m")
-        print("  \033[0;37m/add_device 172.21.1.167 admin r00tme Arista\033[0m")
-        print("  \033[0;37m/update_brand 172.21.1.167 Arista\033[0m")
-        print("  \033[0;37m/devices\033[0m")
-        print()
-        print("\033[1;37m" + "=" * 60 + "\033[0m")
+        sys.stdout.write(self._HELP_TEXT)
+        sys.stdout.flush()
     
     def print_status(self):
         """显示当前状态"""
@@ -704,234 +1340,281 @@ class SMCli:
         available_models = config.get('available_models', {})
         current_model_config = available_models.get(current_model, {})
         
-        print("\033[1;37m" + "=" * 50 + "\033[0m")
-        print("\033[1;36m当前配置状态\033[0m")
-        print("\033[1;37m" + "=" * 50 + "\033[0m")
-        
-        # 检查当前模型的API密钥
-        api_key_status = "✅ 已设置" if current_model_config.get('api_key') else "❌ 未设置"
-        print(f"\033[1;33mAPI密钥:\033[0m {api_key_status}")
-        
-        # 显示当前模型ID
-        model_id = current_model_config.get('model_id', 'N/A')
-        print(f"\033[1;33m模型ID:\033[0m \033[0;37m{model_id}\033[0m")
-        
-        # 显示当前模型名称
-        model_name = current_model_config.get('name', 'N/A')
-        print(f"\033[1;33m当前模型:\033[0m \033[0;37m{model_name}\033[0m")
+        sys.stdout.write(self._STATUS_TEMPLATE.format(
+            # 检查当前模型的API密钥
+            api_key_status="✅ 已设置" if current_model_config.get('api_key') else "❌ 未设置",
+            model_id=current_model_config.get('model_id', 'N/A'),
+            model_name=current_model_config.get('name', 'N/A'),
+            max_steps=config.get('max_steps', 10),
+        ))
+        sys.stdout.flush()
+    
+    def _build_command_table(self) -> Dict[str, Callable[[List[str]], Optional[bool]]]:
+        """构建 命令(含别名) -> 处理函数 的分发表，处理函数接收命令后的参数列表"""
+        def no_args(func):
+            return lambda args: func()
         
-        # 显示AI最大步数
-        max_steps = config.get('max_steps', 10)
-        print(f"\033[1;33mAI max_steps:\033[0m \033[0;37m{max_steps}\033[0m")
+        table = {}
+        for aliases, handler in (
+            (('/quit', '/q', '/exit'), self._cmd_quit),
+            (('/help', '/h'), no_args(self.print_help)),
+            (('/clear', '/cls'), no_args(self.print_gemini_style_header)),
+            (('/status',), no_args(self.print_status)),
+            (('/config',), self._cmd_config),
+            # 设备管理命令
+            (('/devices',), no_args(self.list_devices)),
+            (('/add_device',), self._cmd_add_device),
+            (('/del_device',), self._cmd_del_device),
+            (('/update_brand',), self._cmd_update_brand),
+            (('/search_device',), self._cmd_search_device),
+            (('/device_info',), self._cmd_device_info),
+            (('/migrate',), no_args(self.migrate_config_to_database)),
+            # LLM模型管理命令
+            (('/llm',), no_args(self.list_models)),
+            (('/switch_llm',), self._cmd_switch_llm),
+            (('/set_model_key',), self._cmd_set_model_key),
+            (('/current_llm',), no_args(self.show_current_model)),
+            (('/step',), self._cmd_step),
+            (('/reset',), self._cmd_reset),
+        ):
+            for alias in aliases:
+                table[alias] = handler
+        return table
+    
+    # 最后一个参数为整行剩余文本的命令 -> 参数个数，直接按原文切分，无需分词后再拼接
+    _REST_OF_LINE_FIELDS = {
+        '/update_brand': 2,
+        '/set_model_key': 2,
+        '/search_device': 1,
+    }
+    
+    @staticmethod
+    def _split_args(text: str) -> List[str]:
+        """按空白切分参数；以引号开头的参数可包含空格（如 "my pass"）
+
+        引号只在参数开头起分组作用，并且只在后面紧跟空白或行尾的同种引号处结束，
+        取引号内的原文；其他位置的引号和反斜杠都原样保留（a"b"c、it's、p\\ss 不会被改写），
+        找不到结束引号时该参数按空白切分并保留引号
+        """
+        words = text.split()
+        if not any(word[0] in '\'"' for word in words):
+            return words
         
-        print("\033[1;37m" + "=" * 50 + "\033[0m")
-        print()
+        args = []
+        i, n = 0, len(text)
+        while i < n:
+            if text[i].isspace():
+                i += 1
+                continue
+            quote = text[i]
+            if quote in '\'"':
+                end = text.find(quote, i + 1)
+                while end != -1 and end + 1 < n and not text[end + 1].isspace():
+                    end = text.find(quote, end + 1)
+                if end != -1:
+                    args.append(text[i + 1:end])
+                    i = end + 1
+                    continue
+            end = i
+            while end < n and not text[end].isspace():
+                end += 1
+            args.append(text[i:end])
+            i = end
+        return args
     
     def handle_command(self, command: str) -> bool:
         """处理命令，返回是否继续运行"""
-        parts = command.strip().split()
-        if not parts:
+        head = command.split(None, 1)
+        if not head:
             return True
         
-        cmd = parts[0].lower()
-        
-        if cmd in ['/quit', '/q', '/exit']:
-            print("\033[1;36m👋 再见!\033[0m")
-            return False
-        
-        elif cmd in ['/help', '/h']:
-            self.print_help()
-        
-        elif cmd in ['/clear', '/cls']:
-            self.print_gemini_style_header()
-        
-        elif cmd == '/status':
-            self.print_status()
-        
-        
-        elif cmd == '/config':
-            print("\033[1;37m" + "=" * 50 + "\033[0m")
-            print("\033[1;36m当前配置\033[0m")
-            print("\033[1;37m" + "=" * 50 + "\033[0m")
-            for key, value in self.config_manager.config.items():
-                if key == 'api_key' and value:
-                    print(f"\033[1;33m{key}:\033[0m \033[0;37m{'*' * 20}...\033[0m")
-                else:
-                    print(f"\033[1;33m{key}:\033[0m \033[0;37m{value}\033[0m")
-            print("\033[1;37m" + "=" * 50 + "\033[0m")
-        
-        # 设备管理命令
-        elif cmd == '/devices':
-            self.list_devices()
+        cmd = head[0].lower()
+        rest = head[1] if len(head) > 1 else ""
+        handler = self._commands.get(cmd)
+        if handler is None:
+            print(f"\033[1;31m❌ 未知命令: {cmd}，输入 /help 查看帮助\033[0m")
+            return True
         
-        elif cmd == '/add_device':
-            if len(parts) < 4:
-                print("\033[1;31m❌ 用法: /add_device <host> <username> <password> [brand]\033[0m")
-                print("\033[0;37m示例: /add_device 172.21.1.167 admin r00tme Arista\033[0m")
-                print("\033[0;37m示例: /add_device 172.21.1.81 admin password123 Cisco\033[0m")
-                return True
-            
-            host = parts[1]
-            username = parts[2]
-            password = parts[3]
-            brand = parts[4] if len(parts) > 4 else "Unknown"
-            
-            if self.device_db.add_device(host, username, password, brand):
-                print(f"\033[1;32m✅ 设备 '{host}' ({brand}) 添加成功\033[0m")
-            else:
-                print(f"\033[1;31m❌ 设备 '{host}' 添加失败\033[0m")
+        # 只在确有参数时才切分
+        if not rest:
+            args = []
+        elif cmd in self._REST_OF_LINE_FIELDS:
+            args = rest.split(maxsplit=self._REST_OF_LINE_FIELDS[cmd] - 1)
+        else:
+            args = self._split_args(rest)
         
-        elif cmd == '/del_device':
-            if len(parts) < 2:
-                print("\033[1;31m❌ 用法: /del_device <host>\033[0m")
-                return True
-            
-            host = parts[1]
-            if self.device_db.delete_device(host):
-                print(f"\033[1;32m✅ 设备 '{host}' 删除成功\033[0m")
+        # 只有退出命令返回False
+        return handler(args) is not False
+    
+    def _cmd_quit(self, args: List[str]) -> bool:
+        print("\033[1;36m👋 再见!\033[0m")
+        return False
+    
+    def _cmd_config(self, args: List[str]):
+        print(self._STATUS_RULE + "\033[1;36m当前配置\033[0m\n" + self._STATUS_RULE, end="")
+        for key, value in self.config_manager.config.items():
+            if key == 'api_key' and value:
+                print(f"\033[1;33m{key}:\033[0m \033[0;37m{'*' * 20}...\033[0m")
             else:
-                print(f"\033[1;31m❌ 设备 '{host}' 删除失败或不存在\033[0m")
+                print(f"\033[1;33m{key}:\033[0m \033[0;37m{value}\033[0m")
+        print(self._STATUS_RULE, end="")
+    
+    def _cmd_add_device(self, args: List[str]):
+        if len(args) < 3:
+            print("\033[1;31m❌ 用法: /add_device <host> <username> <password> [brand]\033[0m\n"
+                  "\033[0;37m示例: /add_device 172.21.1.167 admin r00tme Arista\033[0m\n"
+                  "\033[0;37m示例: /add_device 172.21.1.81 admin password123 Cisco\033[0m")
+            return
         
-        elif cmd == '/update_brand':
-            if len(parts) < 3:
-                print("\033[1;31m❌ 用法: /update_brand <host> <brand>\033[0m")
-                print("\033[0;37m示例: /update_brand 172.21.1.167 Arista\033[0m")
-                return True
-            
-            host = parts[1]
-            brand = ' '.join(parts[2:])
-            if self.device_db.update_device(host, brand=brand):
-                print(f"\033[1;32m✅ 设备 '{host}' 品牌已更新为 '{brand}'\033[0m")
-            else:
-                print(f"\033[1;31m❌ 设备 '{host}' 品牌更新失败或设备不存在\033[0m")
+        host = args[0]
+        username = args[1]
+        password = args[2]
+        brand = args[3] if len(args) > 3 else "Unknown"
         
-        elif cmd == '/search_device':
-            if len(parts) < 2:
-                print("\033[1;31m❌ 用法: /search_device <keyword>\033[0m")
-                return True
-            
-            keyword = ' '.join(parts[1:])
-            devices = self.device_db.search_devices(keyword)
-            if devices:
-                print(f"\033[1;36m找到 {len(devices)} 个匹配的设备:\033[0m")
-                for device in devices:
-                    print(f"  \033[1;33m{device['host']}\033[0m - {device['username']}")
-            else:
-                print(f"\033[1;31m❌ 未找到匹配 '{keyword}' 的设备\033[0m")
+        if self.device_db.add_device(host, username, password, brand):
+            print(f"\033[1;32m✅ 设备 '{host}' ({brand}) 添加成功\033[0m")
+        else:
+            print(f"\033[1;31m❌ 设备 '{host}' 添加失败\033[0m")
+    
+    def _cmd_del_device(self, args: List[str]):
+        if len(args) < 1:
+            print("\033[1;31m❌ 用法: /del_device <host>\033[0m")
+            return
         
-        elif cmd == '/device_info':
-            if len(parts) < 2:
-                print("\033[1;31m❌ 用法: /device_info <host>\033[0m")
-                return True
-            
-            host = parts[1]
-            device = self.device_db.get_device(host=host)
-            if device:
-                print(f"\033[1;36m设备信息: {device['host']}\033[0m")
-                print(f"  \033[1;33m主机:\033[0m {device['host']}")
-                print(f"  \033[1;33m用户:\033[0m {device['username']}")
-                print(f"  \033[1;33m密码:\033[0m {'*' * len(device['password'])}")
-            else:
-                print(f"\033[1;31m❌ 未找到设备 '{host}'\033[0m")
-            print()
+        host = args[0]
+        if self.device_db.delete_device(host):
+            print(f"\033[1;32m✅ 设备 '{host}' 删除成功\033[0m")
+        else:
+            print(f"\033[1;31m❌ 设备 '{host}' 删除失败或不存在\033[0m")
+    
+    def _cmd_update_brand(self, args: List[str]):
+        if len(args) < 2:
+            print("\033[1;31m❌ 用法: /update_brand <host> <brand>\033[0m\n"
+                  "\033[0;37m示例: /update_brand 172.21.1.167 Arista\033[0m")
+            return
         
-        elif cmd == '/migrate':
-            self.migrate_config_to_database()
+        host, brand = args
+        if self.device_db.update_device(host, brand=brand):
+            print(f"\033[1;32m✅ 设备 '{host}' 品牌已更新为 '{brand}'\033[0m")
+        else:
+            print(f"\033[1;31m❌ 设备 '{host}' 品牌更新失败或设备不存在\033[0m")
+    
+    def _cmd_search_device(self, args: List[str]):
+        if len(args) < 1:
+            print("\033[1;31m❌ 用法: /search_device <keyword>\033[0m")
+            return
         
-        # LLM模型管理命令
-        elif cmd == '/llm':
-            self.list_models()
+        keyword = args[0]
+        devices = self.device_db.search_devices(keyword)
+        if devices:
+            print(f"\033[1;36m找到 {len(devices)} 个匹配的设备:\033[0m")
+            for device in devices:
+                print(f"  \033[1;33m{device['host']}\033[0m - {device['username']}")
+        else:
+            print(f"\033[1;31m❌ 未找到匹配 '{keyword}' 的设备\033[0m")
+    
+    def _cmd_device_info(self, args: List[str]):
+        if len(args) < 1:
+            print("\033[1;31m❌ 用法: /device_info <host>\033[0m")
+            return
         
-        elif cmd == '/switch_llm':
-            if len(parts) < 2:
-                print("\033[1;31m❌ 用法: /switch_llm <model_key>\033[0m")
-                print("\033[0;37m使用 /llm 查看可用模型\033[0m")
-                return True
-            
-            model_key = parts[1]
-            if self.switch_model(model_key):
-                print(f"\033[1;32m✅ 已切换到模型: {model_key}\033[0m")
-            # switch_model方法已经打印了具体的错误信息，这里不需要重复
+        host = args[0]
+        device = self.device_db.get_device(host=host)
+        if device:
+            print(f"\033[1;36m设备信息: {device['host']}\033[0m")
+            print(f"  \033[1;33m主机:\033[0m {device['host']}")
+            print(f"  \033[1;33m用户:\033[0m {device['username']}")
+            print(f"  \033[1;33m密码:\033[0m {_mask_password(device['password'])}")
+        else:
+            print(f"\033[1;31m❌ 未找到设备 '{host}'\033[0m")
+        print()
+    
+    def _cmd_switch_llm(self, args: List[str]):
+        if len(args) < 1:
+            print("\033[1;31m❌ 用法: /switch_llm <model_key>\033[0m\n"
+                  "\033[0;37m使用 /llm 查看可用模型\033[0m")
+            return
         
-        elif cmd == '/set_model_key':
-            if len(parts) < 3:
-                print("\033[1;31m❌ 用法: /set_model_key <model_key> <api_key>\033[0m")
-                print("\033[0;37m示例: /set_model_key gpt-4 sk-your-openai-key\033[0m")
-                return True
-            
-            model_key = parts[1]
-            api_key = ' '.join(parts[2:])
-            if self.set_model_api_key(model_key, api_key):
-                print(f"\033[1;32m✅ 已设置模型 '{model_key}' 的API密钥\033[0m")
-            else:
-                print(f"\033[1;31m❌ 设置API密钥失败\033[0m")
+        model_key = args[0]
+        if self.switch_model(model_key):
+            print(f"\033[1;32m✅ 已切换到模型: {model_key}\033[0m")
+        # switch_model方法已经打印了具体的错误信息，这里不需要重复
+    
+    def _cmd_set_model_key(self, args: List[str]):
+        if len(args) < 2:
+            print("\033[1;31m❌ 用法: /set_model_key <model_key> <api_key>\033[0m\n"
+                  "\033[0;37m示例: /set_model_key gpt-4 sk-your-openai-key\033[0m")
+            return
         
-        elif cmd == '/current_llm':
-            self.show_current_model()
+        model_key, api_key = args
+        if self.set_model_api_key(model_key, api_key):
+            print(f"\033[1;32m✅ 已设置模型 '{model_key}' 的API密钥\033[0m")
+        else:
+            print(f"\033[1;31m❌ 设置API密钥失败\033[0m")
+    
+    def _cmd_step(self, args: List[str]):
+        if len(args) < 1:
+            # 显示当前步数设置
+            current_steps = self.config_manager.get('max_steps', 10)
+            print(f"\033[1;37m当前最大步数: \033[1;36m{current_steps}\033[0m\n"
+                  "\033[0;37m用法: /step <number> 设置最大步数\033[0m\n"
+                  "\033[0;37m示例: /step 20 设置最大步数为20\033[0m")
+            return
         
-        elif cmd == '/step':
-            if len(parts) < 2:
-                # 显示当前步数设置
-                current_steps = self.config_manager.get('max_steps', 10)
-                print(f"\033[1;37m当前最大步数: \033[1;36m{current_steps}\033[0m")
-                print("\033[0;37m用法: /step <number> 设置最大步数\033[0m")
-                print("\033[0;37m示例: /step 20 设置最大步数为20\033[0m")
+        try:
+            steps = int(args[0])
+            if steps < 1:
+                print("\033[1;31m❌ 步数必须大于0\033[0m")
             else:
-                try:
-                    steps = int(parts[1])
-                    if steps < 1:
-                        print("\033[1;31m❌ 步数必须大于0\033[0m")
-                    else:
-                        self.config_manager.set('max_steps', steps)
-                        print(f"\033[1;32m✅ 最大步数已设置为: {steps}\033[0m")
-                except ValueError:
-                    print("\033[1;31m❌ 请输入有效的数字\033[0m")
-        
-        elif cmd == '/reset':
-            confirm = input("\033[1;33m⚠️  确定要重置所有配置吗? (y/N): \033[0m")
-            if confirm.lower() in ['y', 'yes']:
-                self.config_manager.config = self.config_manager.get_default_config()
-                if self.config_manager.save_config():
-                    print("\033[1;32m✅ 配置已重置\033[0m")
-                    self.setup_agent()
-                else:
-                    print("\033[1;31m❌ 重置失败\033[0m")
+                self.config_manager.set('max_steps', steps)
+                print(f"\033[1;32m✅ 最大步数已设置为: {steps}\033[0m")
+        except ValueError:
+            print("\033[1;31m❌ 请输入有效的数字\033[0m")
+    
+    def _cmd_reset(self, args: List[str]):
+        confirm = input("\033[1;33m⚠️  确定要重置所有配置吗? (y/N): \033[0m")
+        if confirm.lower() in ['y', 'yes']:
+            self.config_manager.config = self.config_manager.get_default_config()
+            if self.config_manager.save_config():
+                print("\033[1;32m✅ 配置已重置\033[0m")
+                self._invalidate_agent()
             else:
-                print("\033[1;31m❌ 已取消\033[0m")
-        
+                print("\033[1;31m❌ 重置失败\033[0m")
         else:
-            print(f"\033[1;31m❌ 未知命令: {cmd}，输入 /help 查看帮助\033[0m")
-        
-        return True
+            print("\033[1;31m❌ 已取消\033[0m")
+    
+    # 设备和模型列表共用的分隔线
+    _TABLE_RULE = "\033[1;37m" + "-" * 80 + "\033[0m\n"
     
     def list_devices(self):
         """列出所有设备"""
-        devices = self.device_db.list_devices()
-        if devices:
-            print(f"\033[1;36m设备列表 (共 {len(devices)} 个):\033[0m")
-            print("\033[1;37m" + "-" * 80 + "\033[0m")
-            print(f"{'主机':<18} {'用户':<10} {'密码':<10} {'品牌'}")
-            print("\033[1;37m" + "-" * 80 + "\033[0m")
-            for device in devices:
-                password_display = '*' * len(device['password'])
-                brand = device.get('brand', 'Unknown')
-                print(f"{device['host']:<18} {device['username']:<10} {password_display:<10} {brand}")
-            print("\033[1;37m" + "-" * 80 + "\033[0m")
-        else:
-            print("\033[1;31m❌ 没有找到任何设备\033[0m")
-            print("\033[0;37m使用 /add_device 命令添加设备\033[0m")
+        rows = self.device_db.list_device_rows()
+        if not rows:
+            print("\033[1;31m❌ 没有找到任何设备\033[0m\n"
+                  "\033[0;37m使用 /add_device 命令添加设备\033[0m")
+            return
+        
+        separator = self._TABLE_RULE
+        row_fmt = "{:<18} {:<10} {:<10} {}\n".format
+        buf = [f"\033[1;36m设备列表 (共 {len(rows)} 个):\033[0m\n", separator,
+               row_fmt('主机', '用户', '密码', '品牌'), separator]
+        buf.extend(row_fmt(host, username, _mask_password(password), brand)
+                   for host, username, password, brand in rows)
+        buf.append(separator)
+        sys.stdout.write("".join(buf))
+        sys.stdout.flush()
     
     def migrate_config_to_database(self):
         """将配置中的设备信息迁移到数据库"""
         print("\033[1;36m开始迁移配置到数据库...\033[0m")
         
         # 由于配置中不再包含默认设备信息，直接显示当前状态
-        devices = self.device_db.list_devices()
-        if devices:
-            print(f"\033[1;36m数据库中共有 {len(devices)} 个设备\033[0m")
+        rows = self.device_db.list_device_rows()
+        if rows:
+            print(f"\033[1;36m数据库中共有 {len(rows)} 个设备\033[0m")
             print("\033[0;37m设备列表:\033[0m")
-            for device in devices:
-                print(f"  - {device['host']} ({device['username']})")
+            for host, username, _, _ in rows:
+                print(f"  - {host} ({username})")
         else:
             print("\033[1;33m数据库中没有设备，请使用 /add_device 添加设备\033[0m")
             print("\033[0;37m示例: /add_device 172.21.1.167 admin r00tme\033[0m")
@@ -941,19 +1624,21 @@ class SMCli:
         available_models = self.config_manager.get("available_models", {})
         current_model = self.config_manager.get("current_model", "deepseek")
         
-        print(f"\033[1;36m可用LLM模型 (当前: {current_model}):\033[0m")
-        print("\033[1;37m" + "-" * 80 + "\033[0m")
-        print(f"{'模型键':<12} {'模型名称':<20} {'状态':<8} {'描述'}")
-        print("\033[1;37m" + "-" * 80 + "\033[0m")
+        separator = self._TABLE_RULE
+        row_fmt = "{:<12} {:<20} {:<8} {}{}\n".format
+        buf = [f"\033[1;36m可用LLM模型 (当前: {current_model}):\033[0m\n", separator,
+               row_fmt('模型键', '模型名称', '状态', '描述', ''), separator]
         
         for model_key, model_config in available_models.items():
             status = "✅ 已配置" if model_config.get("api_key") else "❌ 未配置"
             current_mark = " (当前)" if model_key == current_model else ""
-            print(f"{model_key:<12} {model_config['name']:<20} {status:<8} {model_config['description']}{current_mark}")
+            buf.append(row_fmt(model_key, model_config['name'], status, model_config['description'], current_mark))
         
-        print("\033[1;37m" + "-" * 80 + "\033[0m")
-        print("\033[0;37m使用 /switch_llm <model_key> 切换模型\033[0m")
-        print("\033[0;37m使用 /set_model_key <model_key> <api_key> 设置API密钥\033[0m")
+        buf.append(separator)
+        buf.append("\033[0;37m使用 /switch_llm <model_key> 切换模型\033[0m\n")
+        buf.append("\033[0;37m使用 /set_model_key <model_key> <api_key> 设置API密钥\033[0m\n")
+        sys.stdout.write("".join(buf))
+        sys.stdout.flush()
     
     def switch_model(self, model_key: str) -> bool:
         """切换LLM模型"""
@@ -972,8 +1657,9 @@ class SMCli:
         # 更新当前模型
         self.config_manager.set("current_model", model_key)
         
-        # 重新初始化代理
-        self.setup_agent(model_key)
+        # 模型和密钥均未变化时沿用现有代理，否则等下一条对话消息时重新初始化
+        if not self._agent_is_current(model_key):
+            self._invalidate_agent()
         
         return True
     
@@ -989,10 +1675,10 @@ class SMCli:
         available_models[model_key]["api_key"] = api_key
         self.config_manager.set("available_models", available_models)
         
-        # 如果当前模型是刚设置密钥的模型，重新初始化代理
+        # 如果当前模型是刚设置密钥的模型，下一条对话消息时重新初始化代理
         current_model = self.config_manager.get("current_model", "deepseek")
-        if model_key == current_model:
-            self.setup_agent(model_key)
+        if model_key == current_model and not self._agent_is_current(model_key):
+            self._invalidate_agent()
         
         return True
     
@@ -1009,129 +1695,104 @@ class SMCli:
         else:
             print(f"\033[1;31m❌ 当前模型 '{current_model}' 配置异常\033[0m")
     
-    def print_gemini_style_header(self):
-        """打印Gemini风格的启动界面"""
-        print("\033[2J\033[H")  # 清屏
-        
+    # 启动界面内容固定，拼好后一次写出
+    _HEADER_TEXT = (
         # 模拟终端提示符
-        print("\033[0;37m(base) allinone@WENZHUCAI-2 sm-cli % sm-cli\033[0m")
-        print()
-        
+        "\033[0;37m(base) allinone@WENZHUCAI-2 sm-cli % sm-cli\033[0m\n"
+        "\n"
         # 像素化标题 - 仿照GEMINI样式
-        self.print_pixelated_title()
-        print()
-        
+        + _TITLE_CACHED
+        + "\n"
         # Tips部分 - 仿照Gemini样式
-        print("\033[1;37mTips for getting started:\033[0m")
-        print()
-        print("  \033[0;37m1. Ask questions about network devices or run commands.\033[0m")
-        print("  \033[0;37m2. Be specific for the best results.\033[0m")
-        print("  \033[0;37m3. Create SM-CLI.md files to customize your interactions.\033[0m")
-        print("  \033[0;37m4. \033[0m\033[1;35m/help\033[0m\033[0;37m for more information.\033[0m")
-        print()
-        
+        "\033[1;37mTips for getting started:\033[0m\n"
+        "\n"
+        "  \033[0;37m1. Ask questions about network devices or run commands.\033[0m\n"
+        "  \033[0;37m2. Be specific for the best results.\033[0m\n"
+        "  \033[0;37m3. Create SM-CLI.md files to customize your interactions.\033[0m\n"
+        "  \033[0;37m4. \033[0m\033[1;35m/help\033[0m\033[0;37m for more information.\033[0m\n"
+        "\n"
         # 更新通知框 - 仿照Gemini样式
-        print("\033[1;35mSM-CLI is Ready!\033[0m")
-        print()
+        "\033[1;35mSM-CLI is Ready!\033[0m\n"
+        "\n"
+    )
+    _HEADER_PLAIN = _ANSI_RE.sub("", _HEADER_TEXT)
+    
+    def print_gemini_style_header(self):
+        """打印Gemini风格的启动界面"""
+        if _IS_TTY:
+            sys.stdout.write("\033[2J\033[H\n" + self._HEADER_TEXT)  # 清屏
+        else:
+            sys.stdout.write("\n" + self._HEADER_PLAIN)
+        sys.stdout.flush()
     
-    def print_pixelated_title(self):
-        """打印像素化标题，仿照GEMINI样式"""
-        # 定义渐变色彩序列（从蓝色到紫色到粉红色）
-        colors = [
-            "\033[1;34m",   # 蓝色
-            "\033[1;35m",   # 紫色
-            "\033[1;95m",   # 亮紫色
-            "\033[1;91m",   # 亮红色
-            "\033[1;31m",   # 红色
-        ]
-        
-        # 定义像素化字母图案（每个字母7x9像素）
-        letters = {
-            'S': [
-                " ██████ ",
-                "██    ██",
-                "██      ",
-                " ██████ ",
-                "      ██",
-                "██    ██",
-                " ██████ "
-            ],
-            'M': [
-                "██     ██",
-                "███   ███",
-                "██ █ █ ██",
-                "██  █  ██",
-                "██     ██",
-                "██     ██",
-                "██     ██"
-            ],
-            '-': [
-                "         ",
-                "         ",
-                "         ",
-                " ███████ ",
-                "         ",
-                "         ",
-                "         "
-            ],
-            'C': [
-                "  ██████ ",
-                " ██    ██",
-                "██       ",
-                "██       ",
-                "██       ",
-                " ██    ██",
-                "  ██████ "
-            ],
-            'L': [
-                "██       ",
-                "██       ",
-                "██       ",
-                "██       ",
-                "██       ",
-                "██       ",
-                "█████████"
-            ],
-            'I': [
-                "█████████",
-                "    █    ",
-                "    █    ",
-                "    █    ",
-                "    █    ",
-                "    █    ",
-                "█████████"
-            ]
-        }
-        
-        # 打印标题
-        title = "SM-CLI"
-        for row in range(7):  # 7行像素
-            line = ""
-            for i, char in enumerate(title):
-                if char in letters:
-                    # 根据位置选择颜色，创建渐变效果
-                    color_index = min(i, len(colors) - 1)
-                    color = colors[color_index]
-                    
-                    # 添加像素行
-                    pixel_row = letters[char][row]
-                    line += f"{color}{pixel_row}\033[0m"
-                    
-                    # 字母间添加空格
-                    if i < len(title) - 1:
-                        line += " "
-                else:
-                    # 对于空格或其他字符
-                    line += "         "
-            
-            print(line)
-
     def print_input_prompt(self):
         """打印简洁的输入提示符"""
         print("\033[1;34m> \033[0m", end="", flush=True)
 
+    def setup_readline(self):
+        """启用readline行编辑和历史记录，仅交互模式需要"""
+        try:
+            import readline
+        except ImportError:
+            return
+        
+        history_file = self.config_manager.config_path.parent / "history"
+        try:
+            readline.read_history_file(history_file)
+        except OSError:
+            pass
+        readline.set_history_length(HISTORY_LENGTH)
+        
+        # Tab补全命令和设备地址；命令中可能包含 / 和 -，只按空白分隔
+        readline.set_completer(self._complete)
+        readline.set_completer_delims(" \t\n")
+        if readline.__doc__ and "libedit" in readline.__doc__:
+            readline.parse_and_bind("bind ^I rl_complete")
+        else:
+            readline.parse_and_bind("tab: complete")
+        
+        def save_history():
+            # 含密码或API密钥的命令不写入历史文件（本次会话中仍可用方向键调出）
+            for index in reversed(range(readline.get_current_history_length())):
+                words = (readline.get_history_item(index + 1) or "").split(None, 1)
+                if words and words[0].lower() in self._HISTORY_EXCLUDED_CMDS:
+                    readline.remove_history_item(index)
+            try:
+                # 历史文件只允许当前用户读写
+                os.close(os.open(history_file, os.O_WRONLY | os.O_CREAT, 0o600))
+                os.chmod(history_file, 0o600)
+                readline.write_history_file(history_file)
+            except OSError:
+                pass
+        
+        atexit.register(save_history)
+    
+    # 参数中带有密码或API密钥、不保存到历史文件的命令
+    _HISTORY_EXCLUDED_CMDS = frozenset({'/add_device', '/set_model_key'})
+    
+    # 第一个参数为设备地址的命令，Tab补全时提示数据库中的设备
+    _HOST_ARG_CMDS = frozenset({'/del_device', '/device_info', '/update_brand'})
+    
+    def _complete(self, text: str, state: int) -> Optional[str]:
+        """readline补全函数：补全命令名，以及设备类命令的主机参数"""
+        if state == 0:
+            import readline
+            words = readline.get_line_buffer()[:readline.get_endidx()].split()
+            if not words or (len(words) == 1 and text):
+                candidates = self._commands
+            elif words[0].lower() in self._HOST_ARG_CMDS and len(words) - bool(text) == 1:
+                candidates = [row[0] for row in self.device_db.list_device_rows()]
+            else:
+                candidates = ()
+            self._completion_matches = sorted(c for c in candidates if c.startswith(text))
+        
+        matches = self._completion_matches
+        return matches[state] if state < len(matches) else None
+    
     def run(self):
         """运行CLI"""
+        self.setup_readline()
+        
         # 显示Gemini风格的启动界面
         self.print_gemini_style_header()
         
@@ -1154,6 +1815,8 @@ class SMCli:
                     continue
                 
                 # 处理AI对话
+                if self.agent is None:
+                    self.setup_agent()
                 if not self.agent:
                     print("\033[1;31m❌ AI代理未初始化，请先设置API密钥\033[0m")
                     print("  使用命令: /set api_key <your_key>")
@@ -1183,11 +1846,14 @@ class SMCli:
 
 def main():
     """主函数"""
-    parser = argparse.ArgumentParser(description='SM-CLI: 智能网络设备管理工具')
-    parser.add_argument('--config', '-c', help='配置文件路径')
-    parser.add_argument('--version', '-v', action='version', version='SM-CLI 1.0.0')
-    
-    args = parser.parse_args()
+    # 无参数启动是最常见的情况，此时不必导入和构建argparse
+    if len(sys.argv) > 1:
+        import argparse
+        parser = argparse.ArgumentParser(description='SM-CLI: 智能网络设备管理工具')
+        parser.add_argument('--config', '-c', help='配置文件路径')
+        parser.add_argument('--version', '-v', action='version', version='SM-CLI 1.0.0')
+        
+        args = parser.parse_args()
     
     try:
         cli = SMCli()